@@ -1,8 +1,33 @@
 import json, re
+from collections import deque
 from openai import OpenAI
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
+# Fast HTML parsing when available (pip install selectolax / lxml)
+try:
+    from selectolax.parser import HTMLParser
+except Exception:
+    HTMLParser = None
+try:
+    from lxml import etree  # noqa: F401
+    BS4_PARSER = "lxml"
+except Exception:
+    BS4_PARSER = "html.parser"
+
+try:
+    import orjson  # pip install orjson
+except Exception:
+    orjson = None
+
+def dumps_json(obj):
+    if orjson is not None:
+        try: return orjson.dumps(obj).decode("utf-8")
+        except TypeError: pass
+    return json.dumps(obj)
+
 # Search backend import (prefer new name `ddgs`)
 try:
     from ddgs import DDGS  # pip install ddgs
@@ -16,10 +41,23 @@ MODEL    = "openai/gpt-oss-20b" # change if needed
 
 SNIPPET_LEN = 120
 MAX_TOOL_ROUNDS = 1
+MAX_TOKENS = 384        # every round; gpt-oss reasoning tokens count against this
 MAX_HISTORY_CHARS = 8000
 
 client = OpenAI(base_url=BASE_URL, api_key=API_KEY)
 
+def make_session(headers=None):
+    # Keep-alive pool so repeated fetches skip the TCP/TLS handshake.
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=32, pool_maxsize=32,
+                          max_retries=Retry(total=2, backoff_factor=0.3))
+    session.mount("http://", adapter); session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    if headers: session.headers.update(headers)
+    return session
+
+WEB_SESSION = make_session({"User-Agent":"Mozilla/5.0"})
+
 TOOLS = [
   {"type":"function","function":{
     "name":"web_search",
@@ -52,30 +90,40 @@ TOOLS = [
 SYSTEM = {"role":"system","content":"You can call tools. Always use web_search first for fresh info. Only call fetch_url after you have a specific article URL. Never call fetch_url on a homepage. After using tools, answer in plain text with short bullets and clickable links. Do not emit channel tags."}
 
 # ---------- Helpers ----------
-def prune_history(messages, max_chars=MAX_HISTORY_CHARS):
-    if not messages: return messages
-    system = [m for m in messages if m["role"]=="system"][:1]
-    other  = [m for m in messages if m["role"]!="system"]
-    total = 0; kept=[]
-    for m in reversed(other):
-        chunk = m.get("content") or ""
-        if isinstance(chunk,(dict,list)): chunk = json.dumps(chunk)
-        total += len(chunk); kept.append(m)
-        if total >= max_chars: break
-    kept.reverse()
-    return system + kept
+def msg_len(m):
+    chunk = m.get("content") or ""
+    if isinstance(chunk,(dict,list)): chunk = dumps_json(chunk)
+    return len(chunk)
+
+class ChatHistory:
+    """Messages plus a running char count, so pruning never re-measures the chat.
+
+    messages[0] is the system prompt; lens[i] is the length of messages[i+1].
+    """
+    def __init__(self, system):
+        self.messages = [system]
+        self.lens = deque()
+        self.total = 0
+
+    def append(self, m):
+        n = msg_len(m)
+        self.messages.append(m); self.lens.append(n); self.total += n
+
+def prune_history(history, max_chars=MAX_HISTORY_CHARS):
+    # Keep the newest messages that reach max_chars; evict oldest-first in place,
+    # touching only the evicted items. The system prompt at index 0 is never popped.
+    lens = history.lens; drop = 0
+    while len(lens) > 1 and history.total - lens[0] >= max_chars:
+        history.total -= lens.popleft(); drop += 1
+    if drop: del history.messages[1:1 + drop]
 
 def as_text(content):
     if isinstance(content, list):
-        parts = []
-        for p in content:
-            if isinstance(p, dict) and "text" in p:
-                parts.append(p["text"])
-            else:
-                parts.append(str(p))
-        return "".join(parts)
+        return "".join(p["text"] if isinstance(p, dict) and "text" in p else str(p) for p in content)
     return content or ""
 
+_PAT1 = re.compile(r"to=functions\.([A-Za-z0-9_]+).*?(?:<\|message\|>|\|message\|>)(\{.*?\})(?=(?:<\||\|start\||$))", re.S)
+
 def extract_tool_markups(text):
     """
     Handle LM-style channel tags like:
@@ -83,9 +131,8 @@ def extract_tool_markups(text):
     """
     text = as_text(text)
     calls=[]
-    if "to=functions." not in text: return calls
-    pat = r"to=functions\.([A-Za-z0-9_]+).*?(?:<\|message\|>|\|message\|>)(\{.*?\})(?=(?:<\||\|start\||$))"
-    for m in re.finditer(pat, text, flags=re.S):
+    if "to=functions." not in text or "message|>" not in text or "{" not in text: return calls
+    for m in _PAT1.finditer(text):
         name = m.group(1); arg_str = m.group(2).strip()
         try: args = json.loads(arg_str)
         except Exception:
@@ -94,8 +141,10 @@ def extract_tool_markups(text):
         calls.append({"name":name,"arguments":args})
     return calls
 
+_DDGS = DDGS()  # reuse one client (and its HTTP session) across searches
+
 def do_web_search(q, k):
-    hits = list(DDGS().text(q, max_results=k))
+    hits = list(_DDGS.text(q, max_results=k))
     out=[]
     for h in hits[:k]:
         snip = (h.get("body") or "")
@@ -103,34 +152,48 @@ def do_web_search(q, k):
         out.append({"title":h.get("title"),"href":h.get("href"),"snippet":snip})
     return out
 
+def html_to_text(raw):
+    if HTMLParser is not None:
+        tree = HTMLParser(raw)
+        for tag in tree.css("script,style,noscript"): tag.decompose()
+        root = tree.body or tree.root
+        return root.text(separator=" ", strip=True) if root is not None else ""
+    soup = BeautifulSoup(raw, BS4_PARSER)
+    for tag in soup(["script","style","noscript"]): tag.decompose()
+    return soup.get_text(" ", strip=True)
+
 def do_fetch_url(url, limit):
-    r = requests.get(url, timeout=15, headers={"User-Agent":"Mozilla/5.0"})
-    soup = BeautifulSoup(r.text, "html.parser")
-    text = soup.get_text(" ", strip=True)[:limit]
+    cap = max(limit * 10, 32_000); buf = bytearray()
+    with WEB_SESSION.get(url, timeout=15, stream=True) as r:
+        for chunk in r.iter_content(8192):
+            buf += chunk
+            if len(buf) >= cap: break
+    text = html_to_text(bytes(buf))[:limit]
     return {"url":url,"text":text,"truncated_to":limit}
 
 # ---------- Chat turn ----------
-def run_turn(user_text, messages):
-    messages.append({"role":"user","content":user_text})
+def run_turn(user_text, history):
+    history.append({"role":"user","content":user_text})
     tool_rounds = 0
     accum = {"web_results": None, "fetched": []}
+    nudged = False
     while True:
-        messages[:] = prune_history(messages)
+        prune_history(history)
         tools_arg = TOOLS if tool_rounds < MAX_TOOL_ROUNDS else None
         resp = client.chat.completions.create(
-            model=MODEL, messages=messages, tools=tools_arg, temperature=0.2, max_tokens=384
+            model=MODEL, messages=history.messages, tools=tools_arg, temperature=0.2, max_tokens=MAX_TOKENS
         )
         # Guard: LM Studio may return an error object without `choices` if BASE_URL/model is wrong.
         if not getattr(resp, "choices", None) or not resp.choices:
             print("\n[ERROR] chat.completions returned no choices. Verify LM Studio server URL includes /v1, model is loaded, and server is running.")
             print("Raw response:", resp)
-            return messages
+            return history
         msg = resp.choices[0].message
 
         # 1) Handle LM-style inline tool markup
         markup_calls = extract_tool_markups(getattr(msg, "content", ""))
         if tools_arg and markup_calls:
-            messages.append({"role":"assistant","content": as_text(msg.content)})
+            history.append({"role":"assistant","content": as_text(msg.content)})
             for i, mc in enumerate(markup_calls):
                 name = mc["name"]; args = mc.get("arguments", {})
                 if name == "web_search":
@@ -142,14 +205,14 @@ def run_turn(user_text, messages):
                     accum["fetched"].append(out)
                 else:
                     out = {"error":"unknown tool"}
-                messages.append({"role":"tool","tool_call_id":f"markup-{i}","name":name,"content":json.dumps(out)})
+                history.append({"role":"tool","tool_call_id":f"markup-{i}","name":name,"content":dumps_json(out)})
             tool_rounds += 1
-            messages.append({"role":"system","content":"Using the gathered tool outputs, answer in plain text with 5 bullet headlines and clickable links. Do not call tools."})
+            history.append({"role":"system","content":"Using the gathered tool outputs, answer in plain text with 5 bullet headlines and clickable links. Do not call tools."})
             continue
 
         # 2) Handle OpenAI-style tool_calls
         if tools_arg and getattr(msg, "tool_calls", None):
-            messages.append({"role":"assistant","tool_calls": msg.tool_calls})
+            history.append({"role":"assistant","tool_calls": msg.tool_calls})
             for tc in msg.tool_calls:
                 name = tc.function.name
                 args = json.loads(tc.function.arguments or "{}")
@@ -161,9 +224,9 @@ def run_turn(user_text, messages):
                     accum["fetched"].append(out)
                 else:
                     out = {"error":"unknown tool"}
-                messages.append({"role":"tool","tool_call_id": tc.id,"name": name,"content": json.dumps(out)})
+                history.append({"role":"tool","tool_call_id": tc.id,"name": name,"content": dumps_json(out)})
             tool_rounds += 1
-            messages.append({"role":"system","content":"Using the gathered tool outputs, answer in plain text with 5 bullet headlines and clickable links. Do not call tools."})
+            history.append({"role":"system","content":"Using the gathered tool outputs, answer in plain text with 5 bullet headlines and clickable links. Do not call tools."})
             continue
 
         # 3) Final assistant text
@@ -178,25 +241,32 @@ def run_turn(user_text, messages):
                     bullets.append(f"- {t} — {u}")
                 content = "Top results:\n" + "\n".join(bullets)
                 print("\nASSISTANT:\n" + content)
-                messages.append({"role":"assistant","content":content})
-                return messages
-            # If no accumulated results, nudge once more for summary
-            messages.append({"role":"assistant","content":""})
-            messages.append({"role":"system","content":"Answer now in plain text using gathered tool outputs. No tags. If none, say you could not find results."})
+                history.append({"role":"assistant","content":content})
+                return history
+            # If no accumulated results, nudge once more for summary; after that
+            # give a fixed reply rather than re-nudging forever.
+            if nudged:
+                content = "I could not find results for that. Try rephrasing or give me a URL."
+                print("\nASSISTANT:\n" + content)
+                history.append({"role":"assistant","content":content})
+                return history
+            history.append({"role":"assistant","content":""})
+            history.append({"role":"system","content":"Answer now in plain text using gathered tool outputs. No tags. If none, say you could not find results."})
+            nudged = True
             continue
         print("\nASSISTANT:\n" + content)
-        messages.append({"role":"assistant","content":content})
-        return messages
+        history.append({"role":"assistant","content":content})
+        return history
 
 # ---------- CLI ----------
 def main():
     print("LM Studio web-augmented chat. Ctrl+C to exit.")
-    messages = [SYSTEM]
+    history = ChatHistory(SYSTEM)
     try:
         while True:
             user_text = input("\nYOU:\n").strip()
             if not user_text: continue
-            messages = run_turn(user_text, messages)
+            history = run_turn(user_text, history)
     except KeyboardInterrupt:
         print("\nBye.")
 
@@ -14,15 +14,58 @@ Key changes:
 """
 
 # pip install flask flask-cors ddgs requests beautifulsoup4
-import json, re, uuid, os, time
+# optional, much faster HTML parsing: pip install selectolax (or lxml)
+# optional, result caching and bounded session storage: pip install cachetools
+# optional, faster JSON encoding of tool outputs: pip install orjson
+import json, re, uuid, os, time, threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from zoneinfo import ZoneInfo
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from ddgs import DDGS
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from bs4 import BeautifulSoup
 
+# HTML parser: prefer selectolax (C engine), then lxml, then the stdlib parser.
+try:
+    from selectolax.parser import HTMLParser
+except Exception:
+    HTMLParser = None
+try:
+    # bs4's lxml builder needs the compiled etree, not just the package.
+    from lxml import etree  # noqa: F401
+    _BS4_PARSER = "lxml"
+except Exception:
+    _BS4_PARSER = "html.parser"
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+# Without cachetools, tool results are not cached and SESSIONS is a plain dict.
+try:
+    from cachetools import LRUCache, TTLCache
+except Exception:
+    LRUCache = TTLCache = None
+
+def encode_json(obj) -> bytes:
+    """Serialize to JSON bytes, preferring orjson when installed."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj)
+        except TypeError:
+            # orjson rejects ints beyond 64 bits and lone surrogates; json doesn't.
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+def dumps_json(obj) -> str:
+    """Serialize tool payloads for the messages list."""
+    return encode_json(obj).decode("utf-8")
+
 LMSTUDIO_BASE = os.environ.get("LMSTUDIO_BASE", "http://127.0.0.1:1234/v1")  # must include /v1
 LMSTUDIO_API_KEY = os.environ.get("LMSTUDIO_API_KEY", "lm-studio")            # any non-empty string
 MODEL = os.environ.get("LMSTUDIO_MODEL", "openai/gpt-oss-20b")               # change to your loaded model
@@ -36,6 +79,29 @@ try:
     ANSWER_RETRY_TOKENS = int(os.environ.get("LMSTUDIO_ANSWER_RETRY_TOKENS", "768"))
 except Exception:
     ANSWER_RETRY_TOKENS = 768
+try:
+    MAX_SESSIONS = int(os.environ.get("MAX_SESSIONS", "1024"))
+except Exception:
+    MAX_SESSIONS = 1024
+
+def _make_session(headers=None):
+    """Build a keep-alive Session so repeated calls reuse warm sockets."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=32,
+        pool_maxsize=32,
+        max_retries=Retry(total=2, backoff_factor=0.3),
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    if headers:
+        session.headers.update(headers)
+    return session
+
+# One pool for LM Studio, one for outbound page fetches.
+LMS_SESSION = _make_session({"Authorization": f"Bearer {LMSTUDIO_API_KEY}"})
+WEB_SESSION = _make_session({"User-Agent": "Mozilla/5.0"})
 
 def get_model_name():
     """Use LMSTUDIO_MODEL when set; otherwise fall back to an available chat model.
@@ -52,7 +118,7 @@ def get_model_name():
         _RESOLVED_MODEL = MODEL
         return _RESOLVED_MODEL
     try:
-        r = requests.get(f"{LMSTUDIO_BASE}/models", timeout=3)
+        r = LMS_SESSION.get(f"{LMSTUDIO_BASE}/models", timeout=3)
         r.raise_for_status()
         ids = [m.get("id") for m in (r.json().get("data") or []) if m.get("id")]
         if MODEL in ids:
@@ -93,6 +159,8 @@ TOOLS = [
   }}
 ]
 
+_TOOLS_JSON = encode_json(TOOLS)
+
 SYSTEM = {"role":"system","content":(
   "You may use tools when the user explicitly asks you to browse/search/fetch, "
   "provides a URL, or asks a question that clearly requires current external "
@@ -244,16 +312,14 @@ def answer_local_datetime(user_msg: str) -> str:
 
 def _as_text(content):
     if isinstance(content, list):
-        parts=[]
-        for p in content:
-            if isinstance(p, dict) and "text" in p:
-                parts.append(p["text"])  # OpenAI content blocks
-            else:
-                parts.append(str(p))
-        return "".join(parts)
+        # OpenAI content blocks carry their text under "text"; stringify anything else.
+        return "".join(p["text"] if isinstance(p, dict) and "text" in p else str(p) for p in content)
     return content or ""
 
 _TAG_RE = re.compile(r"(?:<\|[^>|]+\|>|\|start\||\|assistant\||\|message\||\|system\||\|user\|)")
+_PAT1 = re.compile(r"to=functions\.([A-Za-z0-9_]+).*?(?:<\|message\|>|\|message\|>)(\{.*?\})(?=(?:<\||\|start\||$))", re.S)
+_NAME_PAT = re.compile(r"to=functions\.([A-Za-z0-9_]+)")
+_DEC = json.JSONDecoder()
 
 def strip_lm_tags(s: str) -> str:
     if not s: return s
@@ -268,6 +334,34 @@ def _normalize_tool_name(name: str) -> str:
             n = cand
     return n
 
+def _balanced_object_end(text, start):
+    """Index just past the {...} object opening at `start`, or None if unbalanced.
+
+    Only used when raw_decode fails, so the per-character walk stays off the
+    common path.
+    """
+    depth = 0
+    in_str = False
+    esc = False
+    for k in range(start, len(text)):
+        ch = text[k]
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == '\\':
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch == '{':
+            depth += 1
+        elif ch == '}':
+            depth -= 1
+            if depth == 0:
+                return k + 1
+    return None
+
 def extract_tool_markups(text):
     """Extract tool calls written in LM Studio inline style or relaxed text.
 
@@ -281,11 +375,16 @@ def extract_tool_markups(text):
     if not s or "to=functions." not in s:
         return []
 
+    # Both forms need a JSON object, and only the tag form has a message marker;
+    # plain prose skips the regex engine entirely.
+    if "{" not in s:
+        return []
+    has_msg = "message|>" in s
+
     out = []
 
     # 1) Classic tag form with explicit <|message|>{...}
-    pat1 = r"to=functions\.([A-Za-z0-9_]+).*?(?:<\|message\|>|\|message\|>)(\{.*?\})(?=(?:<\||\|start\||$))"
-    for m in re.finditer(pat1, s, flags=re.S):
+    for m in (_PAT1.finditer(s) if has_msg else ()):
         arg_str = (m.group(2) or "{}").strip()
         try:
             args = json.loads(arg_str)
@@ -302,10 +401,10 @@ def extract_tool_markups(text):
     # 2) Relaxed form: ... to=functions.NAME ... json {...}
     #    We locate each occurrence of to=functions.NAME then parse the nearest JSON object
     text_s = s
+    swapped = None
     i = 0
-    name_pat = re.compile(r"to=functions\.([A-Za-z0-9_]+)")
     while True:
-        m = name_pat.search(text_s, i)
+        m = _NAME_PAT.search(text_s, i)
         if not m:
             break
         name = _normalize_tool_name(m.group(1))
@@ -314,40 +413,22 @@ def extract_tool_markups(text):
         if jstart == -1:
             i = m.end();
             continue
-        # Parse a balanced JSON object from jstart
-        depth = 0
-        in_str = False
-        esc = False
-        jend = None
-        for k in range(jstart, len(text_s)):
-            ch = text_s[k]
-            if in_str:
-                if esc:
-                    esc = False
-                elif ch == '\\':
-                    esc = True
-                elif ch == '"':
-                    in_str = False
-            else:
-                if ch == '"':
-                    in_str = True
-                elif ch == '{':
-                    depth += 1
-                elif ch == '}':
-                    depth -= 1
-                    if depth == 0:
-                        jend = k + 1
-                        break
-        if jend is None:
-            i = m.end()
-            continue
-        arg_str = text_s[jstart:jend]
+        # Let the C json scanner find the end of the balanced object. Swapping
+        # quotes keeps every index in place, so it works as the loose fallback.
         try:
-            args = json.loads(arg_str)
-        except Exception:
+            args, jend = _DEC.raw_decode(text_s, jstart)
+        except json.JSONDecodeError:
+            if swapped is None:
+                swapped = text_s.replace("'", "\"")
             try:
-                args = json.loads(arg_str.replace("'","\""))
-            except Exception:
+                args, jend = _DEC.raw_decode(swapped, jstart)
+            except json.JSONDecodeError:
+                # Not JSON even loosely. If the braces still balance, keep the
+                # call with empty arguments as before; otherwise skip it.
+                jend = _balanced_object_end(text_s, jstart)
+                if jend is None:
+                    i = m.end()
+                    continue
                 args = {}
         out.append({"name": name, "arguments": args})
         i = jend
@@ -490,6 +571,9 @@ def extract_json_tool_calls(text, default_name=None):
             add_call(call)
     return calls
 
+_FUNCTION_RE = re.compile(r"<function=([A-Za-z0-9_]+)>\s*(.*?)\s*</function>", re.S)
+_PARAMETER_RE = re.compile(r"<parameter=([A-Za-z0-9_]+)>\s*(.*?)\s*</parameter>", re.S)
+
 def extract_xml_tool_calls(text):
     """Extract Qwen-style XML-ish tool calls.
 
@@ -505,19 +589,11 @@ def extract_xml_tool_calls(text):
         return []
 
     calls = []
-    function_re = re.compile(
-        r"<function=([A-Za-z0-9_]+)>\s*(.*?)\s*</function>",
-        flags=re.S,
-    )
-    parameter_re = re.compile(
-        r"<parameter=([A-Za-z0-9_]+)>\s*(.*?)\s*</parameter>",
-        flags=re.S,
-    )
-    for m in function_re.finditer(s):
+    for m in _FUNCTION_RE.finditer(s):
         name = _normalize_tool_name(m.group(1))
         body = m.group(2)
         args = {}
-        for p in parameter_re.finditer(body):
+        for p in _PARAMETER_RE.finditer(body):
             key = p.group(1).strip()
             value = strip_lm_tags(p.group(2)).strip()
             args[key] = value
@@ -526,6 +602,10 @@ def extract_xml_tool_calls(text):
             calls.append({"name": name, "arguments": args})
     return calls
 
+def _may_contain_tool_call(text) -> bool:
+    """Cheap pre-check: every tool-call format we recover needs one of these."""
+    return any(marker in text for marker in ("{", "<function=", "to=functions.", "<tool_call"))
+
 def extract_text_tool_calls(text, default_name=None):
     """Extract any non-OpenAI tool-call format we know how to recover."""
     return (
@@ -534,42 +614,131 @@ def extract_text_tool_calls(text, default_name=None):
         or extract_json_tool_calls(text, default_name=default_name)
     )
 
+# Short-lived result caches so repeated questions and follow-ups don't re-hit
+# DuckDuckGo (and its rate limits) or re-download the same article. Flask can
+# serve requests from several threads, so every access goes through the lock.
+_CACHE_LOCK = threading.RLock()
+_SEARCH_CACHE = TTLCache(maxsize=256, ttl=300) if TTLCache is not None else None
+_FETCH_CACHE = TTLCache(maxsize=256, ttl=900) if TTLCache is not None else None
+
+def _cache_get(cache, key):
+    if cache is None:
+        return None
+    with _CACHE_LOCK:
+        return cache.get(key)
+
+def _cache_put(cache, key, value):
+    if cache is not None:
+        with _CACHE_LOCK:
+            cache[key] = value
+
+# One DDGS client per thread. DDGS caches engine instances that keep the
+# current query on the instance (e.g. the Wikipedia engine's search_url), so a
+# shared client would let overlapping searches mix up their requests.
+_DDGS_LOCAL = threading.local()
+
+def _ddgs():
+    client = getattr(_DDGS_LOCAL, "client", None)
+    if client is None:
+        client = _DDGS_LOCAL.client = DDGS()
+    return client
+
 def do_web_search(q, k):
+    key = (q, k)
+    hit = _cache_get(_SEARCH_CACHE, key)
+    if hit is not None:
+        return hit
     q = (q or "").strip()
     if not q:
         return [{"error": "web_search requires a non-empty query"}]
-    hits = list(DDGS().text(q, max_results=k))
+    hits = list(_ddgs().text(q, max_results=k))
     out = []
     for h in hits[:k]:
         snip = (h.get("body") or "")
         if len(snip) > 140: snip = snip[:140] + "..."
         out.append({"title":h.get("title"), "href":h.get("href"), "snippet":snip})
+    _cache_put(_SEARCH_CACHE, key, out)
     return out
 
+def html_to_text(raw: bytes) -> str:
+    """Extract visible page text, skipping script/style blocks."""
+    if HTMLParser is not None:
+        tree = HTMLParser(raw)
+        for tag in tree.css("script,style,noscript"):
+            tag.decompose()
+        root = tree.body or tree.root
+        return root.text(separator=" ", strip=True) if root is not None else ""
+    soup = BeautifulSoup(raw, _BS4_PARSER)
+    for tag in soup(["script", "style", "noscript"]):
+        tag.decompose()
+    return soup.get_text(" ", strip=True)
+
 def do_fetch_url(url, limit):
-    r = requests.get(url, timeout=15, headers={"User-Agent":"Mozilla/5.0"})
-    soup = BeautifulSoup(r.text, "html.parser")
-    text = soup.get_text(" ", strip=True)[:limit]
-    return {"url":url, "text":text, "truncated_to":limit}
+    key = (url, limit)
+    hit = _cache_get(_FETCH_CACHE, key)
+    if hit is not None:
+        return hit
+    # Stream the body and stop once we hold far more markup than `limit` chars
+    # of text could need; long pages no longer pay for bytes we'd discard.
+    cap = max(limit * 10, 32_000)
+    buf = bytearray()
+    with WEB_SESSION.get(url, timeout=15, stream=True) as r:
+        for chunk in r.iter_content(8192):
+            buf += chunk
+            if len(buf) >= cap:
+                break
+        ok = r.ok
+    # Hand the parser raw bytes; it sniffs the encoding without a decode round-trip.
+    text = html_to_text(bytes(buf))[:limit]
+    out = {"url":url, "text":text, "truncated_to":limit}
+    if ok:
+        # Error pages may be transient; only remember successful fetches.
+        _cache_put(_FETCH_CACHE, key, out)
+    return out
+
+def _run_tool(name, args):
+    if name == "web_search":
+        try:
+            return do_web_search(args.get("q",""), args.get("max_results", 5))
+        except Exception as e:
+            return [{"error": f"web_search failed: {e}"}]
+    if name == "fetch_url":
+        try:
+            return do_fetch_url(args.get("url"), int(args.get("max_chars",6000)))
+        except Exception as e:
+            return {"error": f"fetch_url failed: {e}"}
+    return {"error":"unknown tool"}
 
 def run_tool_calls(calls, messages, accum, call_id_prefix):
+    normalized = [_normalize_tool_arguments(c.get("name"), c.get("arguments", {})) for c in calls]
+    # Searches and page fetches are independent blocking round-trips, so overlap
+    # them and pay max() instead of sum() of their latencies. Results keep call order.
+    # Retry-happy models sometimes repeat a call within one round; run each
+    # distinct (tool, arguments) once and hand its result to every duplicate.
+    by_key = {}
+    for i, (name, args) in enumerate(normalized):
+        if name == "fetch_url":
+            by_key.setdefault((name, args.get("url"), args.get("max_chars")), []).append(i)
+        elif name == "web_search":
+            by_key.setdefault((name, args.get("q"), args.get("max_results")), []).append(i)
+    unique = [idxs[0] for idxs in by_key.values()]
+    if len(unique) > 1:
+        with ThreadPoolExecutor(max_workers=min(8, len(unique))) as ex:
+            outs = list(ex.map(lambda i: _run_tool(*normalized[i]), unique))
+    else:
+        outs = [_run_tool(*normalized[i]) for i in unique]
+    results = {}
+    for idxs, out in zip(by_key.values(), outs):
+        for i in idxs:
+            results[i] = out
     for i, c in enumerate(calls):
-        name, args = _normalize_tool_arguments(c.get("name"), c.get("arguments", {}))
+        name, args = normalized[i]
+        out = results[i] if i in results else _run_tool(name, args)
         if name == "web_search":
-            try:
-                out = do_web_search(args.get("q",""), args.get("max_results", 5))
-            except Exception as e:
-                out = [{"error": f"web_search failed: {e}"}]
             accum["web"] = out
         elif name == "fetch_url":
-            try:
-                out = do_fetch_url(args.get("url"), int(args.get("max_chars",6000)))
-            except Exception as e:
-                out = {"error": f"fetch_url failed: {e}"}
             accum["fetched"].append(out)
-        else:
-            out = {"error":"unknown tool"}
-        messages.append({"role":"tool","tool_call_id":c.get("id") or f"{call_id_prefix}-{i}","name":name,"content":json.dumps(out)})
+        messages.append({"role":"tool","tool_call_id":c.get("id") or f"{call_id_prefix}-{i}","name":name,"content":dumps_json(out)})
 
 def _extract_weather_location(text):
     s = _as_text(text)
@@ -647,7 +816,7 @@ def force_web_search(user_msg, messages, accum):
         "role": "system",
         "content": (
             "Web search results for the user's current-information request:\n"
-            f"{json.dumps(out)}"
+            f"{dumps_json(out)}"
         ),
     })
 
@@ -707,24 +876,43 @@ def render_fallback_summary(accum: dict) -> str:
         return "I couldn't generate a summary from tools. Try rephrasing or provide a URL."
     return "\n".join(lines)
 
+# (content, encoded bytes) of the last system prompt sent. The prompt only
+# changes when its embedded clock ticks over, so most calls reuse the bytes.
+_SYSTEM_JSON = ("", b"")
+
+def _encode_messages(messages) -> bytes:
+    global _SYSTEM_JSON
+    parts = []
+    rest = messages
+    first = messages[0] if messages else None
+    if isinstance(first, dict) and first.get("role") == "system" and first.keys() == {"role", "content"}:
+        content, encoded = _SYSTEM_JSON
+        if first["content"] != content:
+            encoded = encode_json(first)
+            _SYSTEM_JSON = (first["content"], encoded)
+        parts.append(encoded)
+        rest = messages[1:]
+    if rest:
+        parts.append(encode_json(rest)[1:-1])
+    return b"[" + b",".join(parts) + b"]"
+
 def chat_once(messages, allow_tools=True, metrics=None, max_tokens=None):
     """Call LM Studio's OpenAI-compatible endpoint via HTTP.
     We bypass the OpenAI SDK to avoid client-side validation issues.
     """
     url = f"{LMSTUDIO_BASE}/chat/completions"
     model_name = get_model_name()
-    payload = {
-        "model": model_name,
-        "messages": messages,
-        "temperature": 0.2,
-        "max_tokens": max_tokens or MAX_TOKENS,
-    }
+    # Assemble the body from pre-encoded pieces so the long system prompt and
+    # the static tool schema are not re-serialized on every call.
+    head = {"model": model_name, "temperature": 0.2, "max_tokens": max_tokens or MAX_TOKENS}
+    body = encode_json(head)[:-1] + b',"messages":' + _encode_messages(messages)
     if allow_tools:
-        payload["tools"] = TOOLS
+        body += b',"tools":' + _TOOLS_JSON
+    body += b"}"
     headers = {"Authorization": f"Bearer {LMSTUDIO_API_KEY}", "Content-Type": "application/json"}
     started = time.perf_counter()
     try:
-        r = requests.post(url, json=payload, headers=headers, timeout=90)
+        r = LMS_SESSION.post(url, data=body, headers=headers, timeout=90)
     except requests.exceptions.RequestException as e:
         raise RuntimeError(
             f"Could not reach LM Studio at {LMSTUDIO_BASE}. "
@@ -755,7 +943,12 @@ def chat_once(messages, allow_tools=True, metrics=None, max_tokens=None):
             "tokens_per_second": (completion_tokens / elapsed) if elapsed > 0 and completion_tokens else None,
             "stop_reason": choice.get("finish_reason"),
         })
-    return choice.get("message", {})
+    msg = choice.get("message") or {}
+    # Join list-shaped content once here so every later check in tool_loop
+    # works on a plain string instead of re-joining the parts.
+    if isinstance(msg.get("content"), list):
+        msg["content"] = _as_text(msg["content"])
+    return msg
 
 def summarize_metrics(model_metrics, turn_started, source="model"):
     response_seconds = time.perf_counter() - turn_started
@@ -861,13 +1054,21 @@ def tool_loop(user_msg, history, collect_meta=False):
     msg = ask(allow_tools=allow_tools)
     accum = {"web": None, "fetched": []}
 
+    if not allow_tools:
+        # Fast path for plain chat: a non-empty reply with no tool-call markers
+        # needs none of the extraction, nudge, or recovery rounds below.
+        final = strip_lm_tags(_as_text(msg.get("content"))) if msg else ""
+        if final.strip() and not _may_contain_tool_call(final):
+            messages.append({"role":"assistant","content": final})
+            return finish(final)
+
     if allow_tools and handle_tool_response(msg, messages, accum, "tool"):
         messages.append({"role":"system","content":"Using the gathered tool outputs, answer in plain text with bullet headlines and links. Do not call tools."})
         msg = ask(allow_tools=False)
-    elif allow_tools and "to=functions." in _as_text(msg.get("content", "")):
+    elif allow_tools and "to=functions." in (content_str := _as_text(msg.get("content"))):
         # Heuristic: model tried to call a tool but we couldn't parse it. Nudge once,
         # then process that second response instead of exposing tool markup to the UI.
-        messages.append({"role":"assistant","content": _as_text(msg.get("content"))})
+        messages.append({"role":"assistant","content": content_str})
         messages.append({"role":"system","content":"If you need tools, emit a valid tool_call or a JSON object like {\"name\":\"web_search\",\"arguments\":{\"q\":\"...\"}}. Otherwise, answer directly in plain text."})
         msg = ask(allow_tools=True)
         if handle_tool_response(msg, messages, accum, "tool-retry"):
@@ -940,21 +1141,34 @@ def tool_loop(user_msg, history, collect_meta=False):
 app = Flask(__name__, static_url_path="", static_folder="static")
 CORS(app)
 
-SESSIONS = {}  # in-memory chat state
+# In-memory chat state. Bounded so a long-running server evicts the least
+# recently used threads instead of keeping every history forever (unbounded
+# plain dict when cachetools isn't installed).
+SESSIONS = LRUCache(maxsize=MAX_SESSIONS) if LRUCache is not None else {}
+_SLOCK = threading.RLock()
 
 def get_session(thread):
-    existing = SESSIONS.get(thread)
-    if isinstance(existing, dict):
-        existing.setdefault("history", [])
-        existing.setdefault("display", [])
-        return existing
-    if isinstance(existing, list):
-        session = {"history": existing, "display": []}
+    with _SLOCK:
+        existing = SESSIONS.get(thread)
+        if isinstance(existing, dict):
+            existing.setdefault("history", [])
+            existing.setdefault("display", [])
+            existing.setdefault("lock", threading.Lock())
+            return existing
+        if isinstance(existing, list):
+            session = {"history": existing, "display": [], "lock": threading.Lock()}
+            SESSIONS[thread] = session
+            return session
+        session = {"history": [], "display": [], "lock": threading.Lock()}
         SESSIONS[thread] = session
         return session
-    session = {"history": [], "display": []}
-    SESSIONS[thread] = session
-    return session
+
+def find_session(thread):
+    """Return the existing session for `thread`, or None; never creates one."""
+    with _SLOCK:
+        if thread not in SESSIONS:
+            return None
+        return get_session(thread)
 
 def rebuild_history_from_display(session):
     rebuilt = [current_system_message()]
@@ -977,10 +1191,13 @@ def chat():
         session = get_session(thread)
         user_id = str(uuid.uuid4())
         assistant_id = str(uuid.uuid4())
-        history, answer, meta = tool_loop(user_msg, session.get("history", []), collect_meta=True)
-        session["history"] = history
-        session["display"].append({"id": user_id, "role": "user", "content": user_msg})
-        session["display"].append({"id": assistant_id, "role": "assistant", "content": answer, "meta": meta})
+        # Different threads overlap their LM Studio waits on separate request
+        # threads; turns within one thread run in order so history stays linear.
+        with session["lock"]:
+            history, answer, meta = tool_loop(user_msg, session.get("history", []), collect_meta=True)
+            session["history"] = history
+            session["display"].append({"id": user_id, "role": "user", "content": user_msg})
+            session["display"].append({"id": assistant_id, "role": "assistant", "content": answer, "meta": meta})
         return jsonify({
             "thread": thread,
             "answer": answer,
@@ -998,12 +1215,14 @@ def delete_message():
     data = request.get_json(force=True)
     thread = data.get("thread")
     message_id = data.get("id")
-    if not thread or not message_id or thread not in SESSIONS:
+    session = find_session(thread) if thread and message_id else None
+    if session is None:
         return jsonify({"ok": False, "error": "Unknown thread or message."}), 404
-    session = get_session(thread)
-    before = len(session.get("display", []))
-    session["display"] = [m for m in session.get("display", []) if m.get("id") != message_id]
-    rebuild_history_from_display(session)
+    # Wait for any in-flight /chat turn so it can't overwrite this edit.
+    with session["lock"]:
+        before = len(session.get("display", []))
+        session["display"] = [m for m in session.get("display", []) if m.get("id") != message_id]
+        rebuild_history_from_display(session)
     return jsonify({"ok": len(session["display"]) != before, "removed": [message_id]})
 
 @app.post("/message/truncate")
@@ -1011,16 +1230,17 @@ def truncate_message():
     data = request.get_json(force=True)
     thread = data.get("thread")
     message_id = data.get("id")
-    if not thread or not message_id or thread not in SESSIONS:
+    session = find_session(thread) if thread and message_id else None
+    if session is None:
         return jsonify({"ok": False, "error": "Unknown thread or message."}), 404
-    session = get_session(thread)
-    display = session.get("display", [])
-    idx = next((i for i, m in enumerate(display) if m.get("id") == message_id), None)
-    if idx is None:
-        return jsonify({"ok": False, "error": "Unknown message."}), 404
-    removed = [m.get("id") for m in display[idx:]]
-    session["display"] = display[:idx]
-    rebuild_history_from_display(session)
+    with session["lock"]:
+        display = session.get("display", [])
+        idx = next((i for i, m in enumerate(display) if m.get("id") == message_id), None)
+        if idx is None:
+            return jsonify({"ok": False, "error": "Unknown message."}), 404
+        removed = [m.get("id") for m in display[idx:]]
+        session["display"] = display[:idx]
+        rebuild_history_from_display(session)
     return jsonify({"ok": True, "removed": removed})
 
 @app.get("/")
@@ -1028,4 +1248,8 @@ def root():
     return app.send_static_file("index.html")
 
 if __name__ == "__main__":
-    app.run(port=int(os.environ.get("PORT", "7000")), debug=False)
+    # Development server only. For longer-running use, see README:
+    #   gunicorn -w 1 -k gthread --threads 16 --timeout 120 --bind 0.0.0.0:7000 server:app
+    # threaded=True is Werkzeug's default, spelled out because /chat relies on
+    # it to serve several conversations at once.
+    app.run(port=int(os.environ.get("PORT", "7000")), debug=False, threaded=True)